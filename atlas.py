@@ -0,0 +1,126 @@
+import math
+from collections import OrderedDict
+import pygame
+
+class HexSpriteAtlas:
+    """
+    六边形贴图集
+
+    每种区域（以及空地）在每个缩放级别只预渲染一次，生成带边框和名称的六边形贴图，
+    六边形以外的部分使用颜色键透明。绘制时每个格子只需要一次 blit。
+    """
+
+    # 透明部分使用的颜色键
+    COLORKEY = (255, 0, 255)
+    # 最多缓存的缩放级别数量
+    MAX_BUCKETS = 4
+
+    def __init__(self, radius, colors, font=None):
+        """
+        初始化贴图集
+
+        参数:
+            radius: 六边形的半径（像素，未缩放）
+            colors: 颜色字典（empty、border、text）
+            font: 绘制区域名称使用的字体，为 None 时不绘制名称
+        """
+        self.radius = radius
+        self.colors = dict(colors)
+        self.font = font
+        self.buckets = OrderedDict()
+
+    def matches(self, colors, font):
+        """检查贴图集是否使用相同的颜色和字体渲染"""
+        return self.font is font and self.colors == colors
+
+    def get_bucket(self, scale, labels=True, outlines=True):
+        """
+        获取指定缩放级别和细节层次的贴图字典
+
+        返回的字典以区域对象为键（空地为 None），值为 (贴图, 锚点x, 锚点y)，
+        锚点是六边形中心在贴图中的位置。缺少的贴图会在第一次访问时渲染。
+        """
+        key = (round(scale, 3), labels, outlines)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = _StampBucket(self, *key)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def render_stamp(self, district, scale, labels=True, outlines=True):
+        """渲染单个六边形贴图"""
+        scaled_radius = self.radius * scale
+        hex_width = 2 * scaled_radius
+        hex_height = math.sqrt(3) * scaled_radius
+
+        # 名称可能比六边形更宽，贴图需要同时容纳两者
+        lines = []
+        if district and self.font and labels:
+            lines = [self.font.render(line, True, self.colors['text'])
+                     for line in district.short_name.split('\n')]
+        line_height = self.font.get_height() if lines else 0
+        text_width = max((line.get_width() for line in lines), default=0)
+        text_height = line_height * len(lines)
+
+        width = int(math.ceil(max(hex_width, text_width))) + 2
+        height = int(math.ceil(max(hex_height, text_height))) + 2
+        anchor_x = width // 2
+        anchor_y = height // 2
+
+        corners = []
+        for i in range(6):
+            angle_rad = math.pi / 3 * i
+            corners.append((anchor_x + scaled_radius * math.cos(angle_rad),
+                            anchor_y + scaled_radius * math.sin(angle_rad)))
+
+        stamp = pygame.Surface((width, height))
+        stamp.fill(self.COLORKEY)
+        color = district.color if district else self.colors['empty']
+        pygame.draw.polygon(stamp, color, corners)
+        if outlines:
+            pygame.draw.polygon(stamp, self.colors['border'], corners, 1)
+
+        if lines:
+            label = pygame.Surface((width, height), pygame.SRCALPHA)
+            for i, line in enumerate(lines):
+                text_rect = line.get_rect(
+                    center=(anchor_x,
+                            anchor_y - text_height/2 + line_height/2 + i*line_height)
+                )
+                label.blit(line, text_rect)
+            stamp.blit(label, (0, 0))
+
+            # 六边形以外的抗锯齿像素会混入颜色键，改为不透明文字或透明
+            shape = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.polygon(shape, (255, 255, 255, 255), corners)
+            outside = pygame.mask.from_surface(shape)
+            outside.invert()
+            text_mask = pygame.mask.from_surface(label, 127)
+            outside_text = outside.overlap_mask(text_mask, (0, 0))
+            outside.erase(text_mask, (0, 0))
+            outside.to_surface(stamp, setcolor=self.COLORKEY, unsetcolor=None)
+            outside_text.to_surface(stamp, setcolor=self.colors['text'], unsetcolor=None)
+
+        if pygame.display.get_surface() is not None:
+            stamp = stamp.convert()
+        stamp.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return stamp, anchor_x, anchor_y
+
+class _StampBucket(dict):
+    """单个缩放级别的贴图字典，缺少的贴图按需渲染"""
+
+    def __init__(self, atlas, scale, labels, outlines):
+        super().__init__()
+        self.atlas = atlas
+        self.scale = scale
+        self.labels = labels
+        self.outlines = outlines
+
+    def __missing__(self, district):
+        stamp = self.atlas.render_stamp(district, self.scale, self.labels, self.outlines)
+        self[district] = stamp
+        return stamp
@@ -0,0 +1,365 @@
+"""
+HexGrid 与 UI 的无头渲染性能基准测试
+
+使用 SDL 的 dummy 视频驱动运行，不需要显示器。构建从 15x15 到 500x500 的地图，
+按真实密度随机放置 create_districts() 中的区域，然后测量:
+    - HexGrid.draw 在不同缩放级别和视口位置下的耗时
+    - pixel_to_hex 的吞吐量
+    - 整张地图的相邻加成计算（包括命中评估缓存时）
+    - 各个 UI 面板的绘制
+    - 分块稀疏存储的 5000x5000 地图上的绘制、相邻加成计算、城市查询和保存
+
+用法:
+    python benchmark.py                                  # 运行并输出 JSON 结果
+    python benchmark.py --sizes 15 50 --output out.json  # 只测试部分尺寸
+    python benchmark.py --save-baseline                  # 将结果保存为基准
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.25
+        # 与基准比较，任一指标的最小耗时变慢超过容差时以非零状态码退出
+"""
+import os
+
+# 必须在导入 pygame 之前设置，才能无头运行
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import pygame
+from hexgrid import HexGrid
+from district import create_districts, get_rules_version
+from cache import EvaluationCache
+from ui import Panel, DistrictSelector, StatusBar, DescriptionPanel
+
+# 与 main.py 保持一致的窗口和网格参数
+WINDOW_WIDTH = 1200
+WINDOW_HEIGHT = 800
+HEX_RADIUS = 30
+
+DEFAULT_SIZES = [15, 50, 100, 200, 500]
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_TOLERANCE = 0.25
+# 变慢的绝对值小于此值（毫秒）时不视为回退，避免噪声导致误报
+DEFAULT_MIN_DELTA = 0.05
+# 发现回退时重新运行的次数，只有每次都变慢的指标才视为回退
+DEFAULT_RETRIES = 2
+# 耗时低于此值（毫秒）的指标接近计时精度，不参与比较
+MIN_COMPARABLE_MS = 0.01
+# 单次采样的最短耗时（毫秒），很快的函数在一次采样中重复调用多次
+MIN_SAMPLE_MS = 1.0
+
+# 已放置区域占全部格子的比例
+DISTRICT_DENSITY = 0.3
+
+ZOOM_LEVELS = [0.05, 0.2, 0.5, 1.0, 2.0]
+# 视口位置：corner 为地图左上角对齐窗口左上角，center 为地图中央对准窗口中央，
+# 偏移按地图尺寸和缩放计算，保证两种视口下地图都在屏幕内
+VIEWS = ['corner', 'center']
+
+PIXEL_TO_HEX_SAMPLES = 20000
+
+# 分块稀疏存储：在大地图中央放置若干城市，每个城市周围随机放置区域
+SPARSE_SIZE = 5000
+SPARSE_CHUNK_SIZE = 32
+SPARSE_CLUSTERS = 300
+
+COLORS = {
+    'empty': (200, 200, 200),
+    'border': (0, 0, 0),
+    'text': (0, 0, 0),
+    'highlight': (255, 255, 0, 128)
+}
+
+def build_grid(size, districts, seed=0):
+    """构建指定尺寸的地图，并按 DISTRICT_DENSITY 随机放置区域"""
+    rng = random.Random(seed)
+    hex_grid = HexGrid(HEX_RADIUS, size, size)
+    choices = list(districts.values())
+    for q in range(size):
+        for r in range(size):
+            if rng.random() < DISTRICT_DENSITY:
+                hex_grid.place_district(q, r, rng.choice(choices))
+    return hex_grid
+
+def center_offset(hex_grid, q, r, scale):
+    """计算使格子 (q, r) 位于窗口中央的地图偏移"""
+    x, y = hex_grid.hex_to_pixel(q, r)
+    return WINDOW_WIDTH / 2 - x * scale, WINDOW_HEIGHT / 2 - y * scale
+
+def measure(func, min_time=0.2, max_runs=50):
+    """
+    重复采样 func 直到累计耗时超过 min_time（至少一次）
+
+    单次调用耗时不足 MIN_SAMPLE_MS 的函数在每次采样中重复调用多次，
+    使每次采样的耗时远大于计时精度。
+
+    返回:
+        包含每次调用的中位数/最小耗时（毫秒）、采样次数和每次采样调用次数的字典
+    """
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - t0) * 1000
+        if elapsed >= MIN_SAMPLE_MS:
+            break
+        number *= 10
+
+    timings = [elapsed / number]
+    started = time.perf_counter()
+    while len(timings) < max_runs and time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - t0) * 1000 / number)
+    return {
+        'ms': statistics.median(timings),
+        'best_ms': min(timings),
+        'runs': len(timings),
+        'number': number
+    }
+
+def bench_grid(size, districts, screen, font, results, log):
+    """测量单个地图尺寸下的网格相关指标"""
+    hex_grid = build_grid(size, districts)
+    prefix = f"{size}x{size}"
+
+    for scale in ZOOM_LEVELS:
+        for view in VIEWS:
+            if view == 'center':
+                offset_x, offset_y = center_offset(hex_grid, size // 2, size // 2, scale)
+            else:
+                offset_x, offset_y = 0, 0
+            def draw():
+                screen.fill((255, 255, 255))
+                hex_grid.draw(screen, COLORS, font, offset_x, offset_y, scale)
+            name = f"draw/{prefix}/scale={scale}/view={view}"
+            results[name] = measure(draw)
+            log(name, results[name])
+
+    rng = random.Random(1)
+    points = [
+        (rng.randrange(WINDOW_WIDTH), rng.randrange(WINDOW_HEIGHT))
+        for _ in range(PIXEL_TO_HEX_SAMPLES)
+    ]
+    def convert():
+        for x, y in points:
+            hex_grid.pixel_to_hex(x, y, -300, -200, 1.0)
+    name = f"pixel_to_hex/{prefix}/x{PIXEL_TO_HEX_SAMPLES}"
+    results[name] = measure(convert)
+    log(name, results[name])
+
+    name = f"adjacency/{prefix}"
+    results[name] = measure(hex_grid.calculate_total_adjacency)
+    log(name, results[name])
+
+    # 使用内存中的评估缓存重复评估同一布局
+    hex_grid.evaluation_cache = EvaluationCache(':memory:', get_rules_version(districts))
+    name = f"adjacency_cached/{prefix}"
+    results[name] = measure(hex_grid.calculate_total_adjacency)
+    results[name]['hit_rate'] = hex_grid.evaluation_cache.hit_rate()
+    log(name, results[name])
+    hex_grid.evaluation_cache.close()
+    hex_grid.evaluation_cache = None
+
+    return hex_grid
+
+def bench_sparse(districts, screen, font, results, log):
+    """测量分块稀疏存储的大地图上的绘制、相邻加成计算和保存"""
+    rng = random.Random(2)
+    hex_grid = HexGrid(HEX_RADIUS, SPARSE_SIZE, SPARSE_SIZE, SPARSE_CHUNK_SIZE)
+    choices = list(districts.values())
+    center = SPARSE_SIZE // 2
+    for _ in range(SPARSE_CLUSTERS):
+        cluster_q = center + rng.randrange(-400, 400)
+        cluster_r = center + rng.randrange(-400, 400)
+        for q in range(cluster_q - 3, cluster_q + 4):
+            for r in range(cluster_r - 3, cluster_r + 4):
+                if rng.random() < DISTRICT_DENSITY:
+                    hex_grid.place_district(q, r, rng.choice(choices))
+        hex_grid.place_district(cluster_q, cluster_r, districts['city_center'])
+    prefix = f"sparse/{SPARSE_SIZE}x{SPARSE_SIZE}"
+
+    for scale in (0.02, 1.0):
+        # 视口中心对准地图中央
+        offset_x, offset_y = center_offset(hex_grid, center, center, scale)
+        def draw():
+            screen.fill((255, 255, 255))
+            hex_grid.draw(screen, COLORS, font, offset_x, offset_y, scale)
+        name = f"{prefix}/draw/scale={scale}"
+        results[name] = measure(draw)
+        log(name, results[name])
+
+    name = f"{prefix}/adjacency"
+    results[name] = measure(hex_grid.calculate_total_adjacency)
+    log(name, results[name])
+
+    cities = list(hex_grid.cities.cities.values())
+    name = f"{prefix}/city_yields/x{len(cities)}"
+    results[name] = measure(lambda: [hex_grid.cities.city_yields(city) for city in cities])
+    log(name, results[name])
+
+    points = [
+        (center + rng.randrange(-400, 400), center + rng.randrange(-400, 400))
+        for _ in range(PIXEL_TO_HEX_SAMPLES)
+    ]
+    name = f"{prefix}/city_at/x{PIXEL_TO_HEX_SAMPLES}"
+    results[name] = measure(lambda: [hex_grid.cities.city_at(q, r) for q, r in points])
+    log(name, results[name])
+
+    path = os.path.join(tempfile.gettempdir(), 'civ6_planner_benchmark_plan.json')
+    name = f"{prefix}/save"
+    results[name] = measure(lambda: hex_grid.save(path))
+    log(name, results[name])
+    os.remove(path)
+
+def bench_ui(hex_grid, districts, screen, font, results, log):
+    """测量右侧面板和底部描述面板的绘制耗时"""
+    district_selector = DistrictSelector(WINDOW_WIDTH - 250, 10, 240, 400, districts, font)
+    info_panel = Panel(WINDOW_WIDTH - 250, 420, 240, 170, (240, 240, 240), (0, 0, 0))
+    status_bar = StatusBar(WINDOW_WIDTH - 250, 600, 240, 100, (240, 240, 240), (0, 0, 0), font)
+    description_panel = DescriptionPanel(
+        0, WINDOW_HEIGHT - 80, WINDOW_WIDTH, 100, (240, 240, 240), (0, 0, 0), font
+    )
+
+    # 使用一个已放置区域的格子填充面板内容
+    q, r, district = next(hex_grid.iter_districts())
+    info_panel.set_content(
+        [(f"位置: ({q}, {r})", (0, 0, 0)), (f"区域: {district.name}", (0, 0, 0))] +
+        [(f"{k}: +{v}", (0, 100, 0)) for k, v in hex_grid.calculate_adjacency(q, r).items()]
+    )
+    description_panel.set_district(district)
+    mouse_pos = (int(hex_grid.hex_to_pixel(q, r)[0]), int(hex_grid.hex_to_pixel(q, r)[1]))
+
+    benches = {
+        'ui/district_selector': lambda: (
+            district_selector.update(mouse_pos), district_selector.draw(screen)
+        ),
+        'ui/info_panel': lambda: info_panel.draw(screen, font),
+        'ui/status_bar': lambda: (
+            status_bar.update(mouse_pos, (q, r), hex_grid), status_bar.draw(screen)
+        ),
+        'ui/description_panel': lambda: description_panel.draw(screen),
+    }
+    for name, func in benches.items():
+        results[name] = measure(func)
+        log(name, results[name])
+
+def run(sizes, verbose=True):
+    """运行全部基准测试，返回结果字典"""
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    font = pygame.font.SysFont('SimHei', 16)
+    districts = create_districts()
+
+    def log(name, result):
+        if verbose:
+            print(f"{name:<50} {result['ms']:10.3f} ms  ({result['runs']} runs)", file=sys.stderr)
+
+    results = {}
+    smallest_grid = None
+    for size in sorted(sizes):
+        hex_grid = bench_grid(size, districts, screen, font, results, log)
+        if smallest_grid is None:
+            smallest_grid = hex_grid
+    bench_sparse(districts, screen, font, results, log)
+    bench_ui(smallest_grid, districts, screen, font, results, log)
+
+    pygame.quit()
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'video_driver': os.environ.get('SDL_VIDEODRIVER'),
+            'sizes': sorted(sizes),
+            'density': DISTRICT_DENSITY
+        },
+        'results': results
+    }
+
+def compare(report, baseline, tolerance, min_delta=DEFAULT_MIN_DELTA):
+    """
+    与基准结果比较
+
+    使用最小耗时比较，它受系统负载的影响远小于中位数。只有当变慢的比例超过
+    tolerance 且绝对值超过 min_delta 毫秒时才视为回退；基准耗时本身小于
+    min_delta 的指标，绝对值的门槛为基准耗时（即变慢一倍）。基准耗时低于
+    MIN_COMPARABLE_MS 的指标不参与比较。
+
+    返回:
+        [(指标名称, 基准耗时, 当前耗时)] 列表，只包含变慢超过容差的指标
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        base_ms = base.get('best_ms', base['ms'])
+        current_ms = result['best_ms']
+        if base_ms < MIN_COMPARABLE_MS:
+            continue
+        if current_ms > base_ms * (1 + tolerance) and current_ms - base_ms > min(min_delta, base_ms):
+            regressions.append((name, base_ms, current_ms))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="文明6区域规划模拟器渲染性能基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="要测试的地图边长（默认: %(default)s）")
+    parser.add_argument('--output', help="将 JSON 结果写入文件（默认输出到标准输出）")
+    parser.add_argument('--baseline', help="与指定的基准文件比较")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help="将结果保存为基准文件（默认: %(const)s）")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="允许的相对变慢比例（默认: %(default)s）")
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA,
+                        help="视为回退所需的最小变慢毫秒数（默认: %(default)s）")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="发现回退时重新运行以确认的次数（默认: %(default)s）")
+    parser.add_argument('--quiet', action='store_true', help="不输出进度信息")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, verbose=not args.quiet)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta)
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            # 偶发的系统负载会让整轮测试变慢，重新运行并保留每个指标的最小耗时
+            retry = run(args.sizes, verbose=not args.quiet)
+            for name, result in retry['results'].items():
+                if name in report['results']:
+                    report['results'][name]['best_ms'] = min(
+                        report['results'][name]['best_ms'], result['best_ms']
+                    )
+            regressions = compare(report, baseline, args.tolerance, args.min_delta)
+        for name, base_ms, current_ms in regressions:
+            print(f"性能回退: {name}: {base_ms:.3f} ms -> {current_ms:.3f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'civ6-district-planner', 'evaluations.sqlite'
+)
+
+def zobrist_key(q, r, name):
+    """
+    获取格子 (q, r) 上放置某种区域时的 Zobrist 键
+
+    键由坐标和区域名称确定性地生成，因此同一布局在不同会话中的哈希相同。
+    """
+    data = f"{q},{r},{name}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class EvaluationCache:
+    """
+    布局评估结果的磁盘缓存
+
+    以布局的 Zobrist 哈希、评估范围和规则版本为键，保存计算得到的相邻加成。
+    数据保存在 SQLite 文件中，可以跨会话和批量运行复用；条目数超过上限时淘汰
+    最久未使用的条目。最近使用的条目同时保存在内存中，避免每帧都访问磁盘。
+    """
+
+    # 内存中保存的最近条目数量
+    MEMORY_ENTRIES = 1024
+
+    def __init__(self, path, rules_version, max_entries=100000):
+        """
+        初始化缓存
+
+        参数:
+            path: SQLite 文件路径，':memory:' 表示只在内存中缓存
+            rules_version: 规则版本，规则变化后旧的结果不会被使用
+            max_entries: 磁盘上最多保存的条目数量
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.rules_version = rules_version
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS evaluations ('
+            'key TEXT PRIMARY KEY, yields TEXT NOT NULL, last_used INTEGER NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used)'
+        )
+        self.size = self.connection.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+
+    def make_key(self, layout_hash, scope):
+        """生成缓存键"""
+        return f"{self.rules_version}:{layout_hash:016x}:{scope}"
+
+    def get(self, key):
+        """查找缓存的评估结果，未命中时返回 None"""
+        yields = self.memory.get(key)
+        if yields is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return dict(yields)
+
+        row = self.connection.execute(
+            'SELECT yields FROM evaluations WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute(
+            'UPDATE evaluations SET last_used = ? WHERE key = ?', (time.time_ns(), key)
+        )
+        self.connection.commit()
+        yields = json.loads(row[0])
+        self._remember(key, yields)
+        return dict(yields)
+
+    def put(self, key, yields):
+        """保存评估结果"""
+        self._remember(key, dict(yields))
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO evaluations (key, yields, last_used) VALUES (?, ?, ?)',
+            (key, json.dumps(yields, ensure_ascii=False), time.time_ns())
+        )
+        self.size += cursor.rowcount
+        if self.size > self.max_entries:
+            # 一次淘汰十分之一，避免每次写入都要删除
+            evict = self.size - self.max_entries + self.max_entries // 10
+            self.connection.execute(
+                'DELETE FROM evaluations WHERE key IN '
+                '(SELECT key FROM evaluations ORDER BY last_used LIMIT ?)', (evict,)
+            )
+            self.size = self.connection.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+        self.connection.commit()
+
+    def _remember(self, key, yields):
+        self.memory[key] = yields
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.MEMORY_ENTRIES:
+            self.memory.popitem(last=False)
+
+    def hit_rate(self):
+        """返回命中率（0 到 1），尚未查询时返回 0"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'entries': self.size
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        self.connection.close()
@@ -0,0 +1,133 @@
+try:
+    import numpy
+except ImportError:  # 没有 NumPy 时区块不保存区域编号
+    numpy = None
+
+class MapChunk:
+    """地图区块：保存一个 size x size 区域内的格子"""
+
+    __slots__ = ('districts', 'ids', 'count')
+
+    def __init__(self, size):
+        """
+        初始化区块
+
+        参数:
+            size: 区块边长（六边形数量）
+        """
+        # districts[本地q][本地r]
+        self.districts = [[None] * size for _ in range(size)]
+        self.ids = None
+        if numpy is not None:
+            self.ids = numpy.zeros((size, size), dtype=numpy.uint16)
+        self.count = 0
+
+    @property
+    def empty(self):
+        """区块内是否没有任何区域"""
+        return self.count == 0
+
+class ChunkedGrid:
+    """
+    分块稀疏地图存储
+
+    以 (q, r) 为键，提供与 HexGrid.grid 字典相同的读写方式。区块在第一次写入
+    区域时才分配，最后一个区域被移除后释放，因此内存和整图遍历只与已占用的
+    区域大小有关，而与地图的外接矩形无关。
+    """
+
+    def __init__(self, width, height, chunk_size):
+        """
+        初始化分块存储
+
+        参数:
+            width, height: 地图尺寸（六边形数量）
+            chunk_size: 区块边长，必须为偶数，使区块内的奇偶列与全图一致
+        """
+        if chunk_size <= 0 or chunk_size % 2:
+            raise ValueError(f"区块边长必须为正偶数: {chunk_size}")
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.chunks = {}
+
+    def __contains__(self, coords):
+        q, r = coords
+        return 0 <= q < self.width and 0 <= r < self.height
+
+    def __getitem__(self, coords):
+        q, r = coords
+        chunk = self.chunks.get((q // self.chunk_size, r // self.chunk_size))
+        if chunk is None:
+            return None
+        return chunk.districts[q % self.chunk_size][r % self.chunk_size]
+
+    def __setitem__(self, coords, district):
+        q, r = coords
+        chunk_key = (q // self.chunk_size, r // self.chunk_size)
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            if district is None:
+                return
+            chunk = self.chunks[chunk_key] = MapChunk(self.chunk_size)
+
+        column = chunk.districts[q % self.chunk_size]
+        local_r = r % self.chunk_size
+        if column[local_r] is None and district is not None:
+            chunk.count += 1
+        elif column[local_r] is not None and district is None:
+            chunk.count -= 1
+        column[local_r] = district
+
+        if chunk.empty:
+            del self.chunks[chunk_key]
+
+    def items(self):
+        """遍历已占用区块中的所有区域，返回 ((q, r), 区域)"""
+        size = self.chunk_size
+        for (chunk_q, chunk_r), chunk in self.chunks.items():
+            for local_q, column in enumerate(chunk.districts):
+                for local_r, district in enumerate(column):
+                    if district is not None:
+                        yield (chunk_q * size + local_q, chunk_r * size + local_r), district
+
+    def get_column(self, q, r_start, r_end):
+        """获取第 q 列中 [r_start, r_end) 的区域列表，未分配的区块直接填充空地"""
+        size = self.chunk_size
+        chunk_q, local_q = divmod(q, size)
+        column = []
+        r = r_start
+        while r < r_end:
+            chunk_r, local_r = divmod(r, size)
+            stop = min(r_end - r, size - local_r)
+            chunk = self.chunks.get((chunk_q, chunk_r))
+            if chunk is None:
+                column.extend([None] * stop)
+            else:
+                column.extend(chunk.districts[local_q][local_r:local_r + stop])
+            r += stop
+        return column
+
+    def set_id(self, q, r, district_id):
+        """设置格子的区域编号（区块未分配时忽略）"""
+        chunk = self.chunks.get((q // self.chunk_size, r // self.chunk_size))
+        if chunk is not None and chunk.ids is not None:
+            chunk.ids[q % self.chunk_size, r % self.chunk_size] = district_id
+
+    def get_id_window(self, q_start, q_end, r_start, r_end):
+        """获取 [q_start, q_end) x [r_start, r_end) 范围的区域编号数组，只复制已占用的区块"""
+        size = self.chunk_size
+        window = numpy.zeros((q_end - q_start, r_end - r_start), dtype=numpy.uint16)
+        for chunk_q in range(q_start // size, (q_end - 1) // size + 1):
+            for chunk_r in range(r_start // size, (r_end - 1) // size + 1):
+                chunk = self.chunks.get((chunk_q, chunk_r))
+                if chunk is None:
+                    continue
+                q0 = max(q_start, chunk_q * size)
+                q1 = min(q_end, (chunk_q + 1) * size)
+                r0 = max(r_start, chunk_r * size)
+                r1 = min(r_end, (chunk_r + 1) * size)
+                window[q0 - q_start:q1 - q_start, r0 - r_start:r1 - r_start] = \
+                    chunk.ids[q0 - chunk_q * size:q1 - chunk_q * size,
+                              r0 - chunk_r * size:r1 - chunk_r * size]
+        return window
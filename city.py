@@ -0,0 +1,227 @@
+from cache import zobrist_key
+
+CITY_CENTER_NAME = '城市中心'
+# 城市拥有的格子范围（环数）
+CITY_RADIUS = 3
+# 两个城市中心之间的最小距离
+MIN_CITY_DISTANCE = 4
+
+def offset_to_cube(q, r):
+    """将偏移坐标（奇数列下移）转换为立方坐标"""
+    x = q
+    z = r - (q - (q & 1)) // 2
+    return x, -x - z, z
+
+def cube_to_offset(x, y, z):
+    """将立方坐标转换为偏移坐标（奇数列下移）"""
+    return x, z + (x - (x & 1)) // 2
+
+def hex_distance(q1, r1, q2, r2):
+    """计算两个六边形之间的距离"""
+    x1, y1, z1 = offset_to_cube(q1, r1)
+    x2, y2, z2 = offset_to_cube(q2, r2)
+    return max(abs(x1 - x2), abs(y1 - y2), abs(z1 - z2))
+
+def _build_ring_offsets(max_radius):
+    """
+    预先计算每一环的坐标偏移表
+
+    偏移坐标中相邻格子的偏移量取决于列的奇偶，因此按奇偶分别计算。
+
+    返回:
+        rings[奇偶][环数] = [(dq, dr), ...]
+    """
+    rings = []
+    for parity in (0, 1):
+        origin = offset_to_cube(parity, 0)
+        parity_rings = [[] for _ in range(max_radius + 1)]
+        for dx in range(-max_radius, max_radius + 1):
+            for dy in range(max(-max_radius, -dx - max_radius), min(max_radius, -dx + max_radius) + 1):
+                dz = -dx - dy
+                q, r = cube_to_offset(origin[0] + dx, origin[1] + dy, origin[2] + dz)
+                distance = max(abs(dx), abs(dy), abs(dz))
+                parity_rings[distance].append((q - parity, r))
+        rings.append(parity_rings)
+    return rings
+
+RING_OFFSETS = _build_ring_offsets(CITY_RADIUS)
+
+def _tile_key(q, r):
+    """城市拥有格子的哈希键"""
+    return zobrist_key(q, r, '')
+
+def is_city_center(district):
+    """判断区域是否为城市中心"""
+    return district is not None and district.name == CITY_CENTER_NAME
+
+class City:
+    """城市"""
+
+    def __init__(self, city_id, q, r):
+        """
+        初始化城市
+
+        参数:
+            city_id: 城市编号
+            q, r: 城市中心坐标
+        """
+        self.id = city_id
+        self.q = q
+        self.r = r
+        # 名称由中心坐标确定，与建立顺序无关，重新加载地图后保持不变
+        self.name = f"城市({q}, {r})"
+        # 城市拥有的格子
+        self.tiles = set()
+        # 拥有格子集合的哈希，用于区分评估结果缓存
+        self.tiles_hash = 0
+
+    def add_tile(self, tile):
+        """将格子加入城市"""
+        if tile not in self.tiles:
+            self.tiles.add(tile)
+            self.tiles_hash ^= _tile_key(*tile)
+
+    def discard_tile(self, tile):
+        """将格子移出城市"""
+        if tile in self.tiles:
+            self.tiles.discard(tile)
+            self.tiles_hash ^= _tile_key(*tile)
+
+class CityIndex:
+    """
+    城市空间索引
+
+    记录每个格子属于哪个城市，以及每个城市拥有的格子。每个格子属于中心在
+    CITY_RADIUS 环以内的最近城市，距离相同时属于中心坐标较小的城市，因此归属
+    与城市的建立顺序无关，重新加载地图或从快照恢复后保持不变。使用预先计算的
+    环偏移表，查询某格所属城市为 O(1)，查询城市范围和产出为 O(环内格子数)。
+    """
+
+    def __init__(self, hex_grid):
+        """
+        初始化城市索引
+
+        参数:
+            hex_grid: 所属的六边形网格
+        """
+        self.hex_grid = hex_grid
+        self.cities = {}
+        # 格子坐标 -> 城市编号
+        self.owner = {}
+        # 城市中心坐标 -> 城市编号
+        self.centers = {}
+        self.next_id = 1
+
+    def iter_area(self, q, r, radius=CITY_RADIUS):
+        """按由近到远的顺序遍历 (q, r) 周围 radius 环以内、位于地图中的格子"""
+        for ring in RING_OFFSETS[q % 2][:radius + 1]:
+            for dq, dr in ring:
+                tile_q = q + dq
+                tile_r = r + dr
+                if 0 <= tile_q < self.hex_grid.width and 0 <= tile_r < self.hex_grid.height:
+                    yield tile_q, tile_r
+
+    def found_city(self, q, r):
+        """在 (q, r) 建立城市，占据范围内离新城市最近的格子"""
+        city_id = self.centers.get((q, r))
+        if city_id is not None:
+            return self.cities[city_id]
+
+        city = City(self.next_id, q, r)
+        self.next_id += 1
+        self.cities[city.id] = city
+        self.centers[(q, r)] = city.id
+
+        for tile in self.iter_area(q, r):
+            previous = self.owner.get(tile)
+            if previous is not None:
+                if self.find_nearest_city(*tile) is not city:
+                    continue
+                self.cities[previous].discard_tile(tile)
+            self.owner[tile] = city.id
+            city.add_tile(tile)
+        return city
+
+    def remove_city(self, q, r):
+        """移除中心位于 (q, r) 的城市，释放的格子交给范围内最近的其他城市"""
+        city_id = self.centers.pop((q, r), None)
+        if city_id is None:
+            return
+        city = self.cities.pop(city_id)
+        for tile in city.tiles:
+            del self.owner[tile]
+        for tile in city.tiles:
+            nearest = self.find_nearest_city(*tile)
+            if nearest is not None:
+                self.owner[tile] = nearest.id
+                nearest.add_tile(tile)
+
+    def find_nearest_city(self, q, r, radius=CITY_RADIUS):
+        """查找中心在 radius 环以内的最近城市，距离相同时取中心坐标较小者"""
+        for ring in RING_OFFSETS[q % 2][:radius + 1]:
+            found = [
+                (q + dq, r + dr)
+                for dq, dr in ring if (q + dq, r + dr) in self.centers
+            ]
+            if found:
+                return self.cities[self.centers[min(found)]]
+        return None
+
+    def city_at(self, q, r):
+        """获取拥有 (q, r) 格子的城市"""
+        city_id = self.owner.get((q, r))
+        if city_id is None:
+            return None
+        return self.cities[city_id]
+
+    def tiles_in_range(self, city):
+        """
+        获取城市中心 CITY_RADIUS 环以内的所有格子，按由近到远排列
+
+        包括离其他城市中心更近、因而属于其他城市的格子；城市拥有的格子见 city.tiles。
+        """
+        return list(self.iter_area(city.q, city.r))
+
+    def city_yields(self, city):
+        """计算城市范围内所有区域的相邻加成总和（优先使用评估结果缓存）"""
+        cache = self.hex_grid.evaluation_cache
+        if cache is not None:
+            key = cache.make_key(self.hex_grid.layout_hash,
+                                 f"city:{city.q},{city.r}:{city.tiles_hash:016x}")
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        total_bonuses = {}
+        for q, r in city.tiles:
+            for bonus_type, bonus_value in self.hex_grid.calculate_adjacency(q, r).items():
+                total_bonuses[bonus_type] = total_bonuses.get(bonus_type, 0) + bonus_value
+
+        if cache is not None:
+            cache.put(key, total_bonuses)
+        return total_bonuses
+
+    def validate_placement(self, q, r, district):
+        """
+        检查多城市模式下能否在 (q, r) 放置区域
+
+        返回:
+            (是否可以放置, 原因)
+        """
+        current = self.hex_grid.get_district(q, r)
+        if is_city_center(current) and not is_city_center(district):
+            return False, "不能覆盖城市中心，请先删除"
+
+        if is_city_center(district):
+            for tile in self.iter_area(q, r, MIN_CITY_DISTANCE - 1):
+                if tile != (q, r) and tile in self.centers:
+                    return False, f"距离其他城市中心不足{MIN_CITY_DISTANCE}格"
+            return True, ""
+
+        city = self.city_at(q, r)
+        if city is None:
+            return False, "区域必须建在城市范围内"
+        for tile in city.tiles:
+            if tile != (q, r) and self.hex_grid.get_district(*tile) is district:
+                return False, f"{city.name}已有{district.name}"
+        return True, ""
@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 class District:
     """文明6区域类"""
     
@@ -41,6 +44,19 @@ class District:
         
         return None
 
+def get_rules_version(districts):
+    """
+    根据区域的相邻加成规则计算规则版本
+    
+    规则变化时版本随之变化，用于区分缓存的评估结果。
+    """
+    rules = sorted(
+        (district.name, sorted((key, list(bonus)) for key, bonus in district.adjacency_rules.items()))
+        for district in districts.values()
+    )
+    data = json.dumps(rules, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
 # 定义文明6中的主要区域
 def create_districts():
     """创建文明6中的主要区域"""
@@ -0,0 +1,148 @@
+"""
+分块导出高分辨率 PNG 图片
+
+将地图按固定大小的图块逐个用 HexGrid.draw 渲染（每个图块使用不同的偏移），
+再把一整行图块的像素逐行写入 PNG 编码器。峰值内存只与一行图块有关，与输出
+图片的总尺寸无关，因此可以导出打印分辨率的大地图。
+
+用法:
+    python export.py plan.json plan.png              # 按 2 倍缩放导出
+    python export.py plan.json plan.png --scale 4 --tile-size 1024
+"""
+import os
+
+# 必须在导入 pygame 之前设置，才能无头运行
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import math
+import struct
+import sys
+import zlib
+
+import pygame
+from hexgrid import HexGrid
+from district import create_districts
+
+DEFAULT_SCALE = 2.0
+DEFAULT_TILE_SIZE = 512
+# 地图四周留白（像素，缩放后）
+MARGIN = 10
+
+BACKGROUND = (255, 255, 255)
+COLORS = {
+    'empty': (200, 200, 200),
+    'border': (0, 0, 0),
+    'text': (0, 0, 0),
+    'highlight': (255, 255, 0, 128)
+}
+
+class PNGWriter:
+    """逐行写入的 PNG 编码器（8 位 RGB）"""
+
+    def __init__(self, file, width, height, compress_level=6):
+        """
+        初始化编码器并写入文件头
+
+        参数:
+            file: 以二进制方式打开的文件对象
+            width, height: 图片尺寸（像素）
+            compress_level: zlib 压缩级别
+        """
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compress_level)
+
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        # 8 位色深，颜色类型 2（RGB），默认压缩、过滤和非隔行扫描
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def write_row(self, row):
+        """写入一行 RGB 像素数据（长度为 width * 3 字节）"""
+        if len(row) != self.width * 3:
+            raise ValueError(f"行数据长度应为 {self.width * 3} 字节，实际为 {len(row)}")
+        # 每行前的 0 表示不使用过滤器
+        data = self.compressor.compress(b'\x00' + row)
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self.rows_written += 1
+
+    def close(self):
+        """写入剩余的压缩数据和文件尾"""
+        if self.rows_written != self.height:
+            raise ValueError(f"已写入 {self.rows_written} 行，图片高度为 {self.height}")
+        data = self.compressor.flush()
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self._write_chunk(b'IEND', b'')
+
+def get_map_size(hex_grid, scale):
+    """计算地图按 scale 缩放后（含留白）的像素尺寸"""
+    width = ((hex_grid.width - 1) * hex_grid.horizontal_distance + hex_grid.hex_width) * scale
+    height = (hex_grid.height + 0.5) * hex_grid.vertical_distance * scale
+    return int(math.ceil(width)) + MARGIN * 2, int(math.ceil(height)) + MARGIN * 2
+
+def export_png(hex_grid, path, scale=DEFAULT_SCALE, tile_size=DEFAULT_TILE_SIZE, font=None):
+    """
+    将地图分块渲染并导出为 PNG
+
+    参数:
+        hex_grid: 要导出的地图
+        path: 输出文件路径
+        scale: 缩放比例
+        tile_size: 图块边长（像素）
+        font: 区域名称使用的字体，为 None 时按缩放比例创建
+    """
+    if font is None:
+        font = pygame.font.SysFont('SimHei', max(1, int(round(16 * scale))))
+    width, height = get_map_size(hex_grid, scale)
+    # 六边形中心到外接矩形左上角的距离
+    origin_x = MARGIN + hex_grid.radius * scale
+    origin_y = MARGIN + hex_grid.vertical_distance / 2 * scale
+
+    tile = pygame.Surface((tile_size, tile_size))
+    with open(path, 'wb') as f:
+        writer = PNGWriter(f, width, height)
+        for tile_y in range(0, height, tile_size):
+            strip_height = min(tile_size, height - tile_y)
+            # 一行图块的像素，按行拼接
+            rows = [[] for _ in range(strip_height)]
+            for tile_x in range(0, width, tile_size):
+                tile_width = min(tile_size, width - tile_x)
+                tile.fill(BACKGROUND)
+                hex_grid.draw(tile, COLORS, font, origin_x - tile_x, origin_y - tile_y, scale)
+                pixels = pygame.image.tostring(tile, 'RGB')
+                stride = tile_size * 3
+                for y in range(strip_height):
+                    rows[y].append(pixels[y * stride:y * stride + tile_width * 3])
+            for row in rows:
+                writer.write_row(b''.join(row))
+        writer.close()
+    return width, height
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将地图文件导出为高分辨率 PNG 图片")
+    parser.add_argument('plan', help="由 main.py 保存的地图文件（Ctrl+S）")
+    parser.add_argument('output', help="输出的 PNG 文件")
+    parser.add_argument('--scale', type=float, default=DEFAULT_SCALE,
+                        help="缩放比例（默认: %(default)s）")
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                        help="渲染图块的边长（像素，默认: %(default)s）")
+    args = parser.parse_args()
+
+    pygame.init()
+    # 贴图转换像素格式需要一个显示表面
+    pygame.display.set_mode((1, 1))
+    hex_grid = HexGrid.load(args.plan, create_districts())
+    width, height = export_png(hex_grid, args.output, args.scale, args.tile_size)
+    print(f"已导出 {width}x{height} 像素的图片到 {args.output}", file=sys.stderr)
+    pygame.quit()
@@ -1,10 +1,30 @@
+import json
 import math
 import pygame
+from atlas import HexSpriteAtlas
+from cache import zobrist_key
+from chunks import ChunkedGrid
+from city import CityIndex, is_city_center
+
+try:
+    import numpy
+except ImportError:  # 没有 NumPy 时不使用像素块渲染
+    numpy = None
+
+# 细节层次（LOD）阈值：六边形在屏幕上的半径（像素）
+LOD_LABEL_RADIUS = 20  # 小于此值时不绘制区域名称
+LOD_OUTLINE_RADIUS = 8  # 小于此值时不绘制边框
+LOD_BLOCK_RADIUS = 4  # 小于此值时每个六边形绘制为一个像素块
+
+def split_offset(offset):
+    """将偏移拆分为整数部分和 [0, 1) 内的小数部分"""
+    base = math.floor(offset)
+    return base, offset - base
 
 class HexGrid:
     """六边形网格系统"""
     
-    def __init__(self, radius, grid_width, grid_height):
+    def __init__(self, radius, grid_width, grid_height, chunk_size=None):
         """
         初始化六边形网格
         
@@ -12,6 +32,7 @@ class HexGrid:
             radius: 六边形的半径（像素）
             grid_width: 网格的宽度（六边形数量）
             grid_height: 网格的高度（六边形数量）
+            chunk_size: 区块边长（偶数）。指定时使用分块稀疏存储，适合大地图
         """
         self.radius = radius
         self.width = grid_width
@@ -21,11 +42,36 @@ class HexGrid:
         self.horizontal_distance = self.hex_width * 3/4
         self.vertical_distance = self.hex_height
         
+        self.chunk_size = chunk_size
+        
         # 初始化网格数据
-        self.grid = {}
-        for q in range(self.width):
-            for r in range(self.height):
-                self.grid[(q, r)] = None
+        if chunk_size:
+            self.grid = ChunkedGrid(self.width, self.height, chunk_size)
+        else:
+            self.grid = {}
+            for q in range(self.width):
+                for r in range(self.height):
+                    self.grid[(q, r)] = None
+        
+        # 区域编号：0 表示空地，区域对象第一次放置时分配编号
+        self.district_list = [None]
+        self.district_index = {}
+        # 每个格子的区域编号数组，用于缩小时的像素块渲染（分块存储时保存在各区块中）
+        self.district_ids = None
+        if numpy is not None and not chunk_size:
+            self.district_ids = numpy.zeros((self.width, self.height), dtype=numpy.uint16)
+        self._palette = None
+        
+        # 布局的 Zobrist 哈希：所有已放置区域的键的异或，放置和移除时增量更新
+        self.layout_hash = 0
+        # 评估结果缓存（EvaluationCache），为 None 时不使用缓存
+        self.evaluation_cache = None
+        
+        # 城市空间索引，放置或移除城市中心时更新
+        self.cities = CityIndex(self)
+        
+        # 绘制用的六边形贴图集，第一次绘制时创建
+        self.atlas = None
     
     def pixel_to_hex(self, x, y, offset_x=0, offset_y=0, scale=1.0):
         """将屏幕坐标转换为六边形网格坐标（考虑偏移和缩放）"""
@@ -96,57 +142,309 @@ class HexGrid:
     def place_district(self, q, r, district):
         """在指定位置放置区域"""
         if (q, r) in self.grid:
+            previous = self.grid[(q, r)]
             self.grid[(q, r)] = district
+            self.set_district_id(q, r, self.get_district_id(district))
+            if previous is not None:
+                self.layout_hash ^= zobrist_key(q, r, previous.name)
+            if district is not None:
+                self.layout_hash ^= zobrist_key(q, r, district.name)
+            if is_city_center(previous) and not is_city_center(district):
+                self.cities.remove_city(q, r)
+            elif is_city_center(district):
+                self.cities.found_city(q, r)
             return True
         return False
     
     def remove_district(self, q, r):
         """移除指定位置的区域"""
         if (q, r) in self.grid:
+            previous = self.grid[(q, r)]
             self.grid[(q, r)] = None
+            self.set_district_id(q, r, 0)
+            if previous is not None:
+                self.layout_hash ^= zobrist_key(q, r, previous.name)
+            if is_city_center(previous):
+                self.cities.remove_city(q, r)
             return True
         return False
     
+    def get_district_id(self, district):
+        """获取区域的编号，未登记的区域会分配新编号"""
+        if district is None:
+            return 0
+        district_id = self.district_index.get(district)
+        if district_id is None:
+            district_id = len(self.district_list)
+            self.district_list.append(district)
+            self.district_index[district] = district_id
+        return district_id
+    
+    def set_district_id(self, q, r, district_id):
+        """更新格子在区域编号数组中的编号"""
+        if self.chunk_size:
+            self.grid.set_id(q, r, district_id)
+        elif self.district_ids is not None:
+            self.district_ids[q, r] = district_id
+    
+    def get_id_window(self, q_start, q_end, r_start, r_end):
+        """获取指定范围的区域编号数组"""
+        if self.chunk_size:
+            return self.grid.get_id_window(q_start, q_end, r_start, r_end)
+        return self.district_ids[q_start:q_end, r_start:r_end]
+    
+    def get_column(self, q, r_start, r_end):
+        """获取第 q 列中 [r_start, r_end) 的区域列表"""
+        if self.chunk_size:
+            return self.grid.get_column(q, r_start, r_end)
+        return [self.grid[(q, r)] for r in range(r_start, r_end)]
+    
     def get_district(self, q, r):
         """获取指定位置的区域"""
         if (q, r) in self.grid:
             return self.grid[(q, r)]
         return None
     
+    def calculate_adjacency(self, q, r):
+        """
+        计算指定位置区域获得的相邻加成
+        
+        返回:
+            {加成类型: 加成值} 字典，空地返回空字典
+        """
+        district = self.get_district(q, r)
+        total_bonuses = {}
+        if not district:
+            return total_bonuses
+        
+        for neighbor_q, neighbor_r in self.get_neighbors(q, r):
+            neighbor_district = self.get_district(neighbor_q, neighbor_r)
+            if neighbor_district:
+                bonus = district.get_adjacency_bonus(neighbor_district)
+                if bonus:
+                    bonus_type, bonus_value = bonus
+                    if bonus_type in total_bonuses:
+                        total_bonuses[bonus_type] += bonus_value
+                    else:
+                        total_bonuses[bonus_type] = bonus_value
+        return total_bonuses
+    
+    def iter_districts(self):
+        """遍历所有已放置的区域，返回 (q, r, 区域) 元组"""
+        for (q, r), district in self.grid.items():
+            if district:
+                yield q, r, district
+    
+    def calculate_total_adjacency(self):
+        """计算整张地图所有区域的相邻加成总和（优先使用评估结果缓存）"""
+        cache = self.evaluation_cache
+        if cache is not None:
+            key = cache.make_key(self.layout_hash, 'total')
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        
+        total_bonuses = {}
+        for q, r, _ in self.iter_districts():
+            for bonus_type, bonus_value in self.calculate_adjacency(q, r).items():
+                total_bonuses[bonus_type] = total_bonuses.get(bonus_type, 0) + bonus_value
+        
+        if cache is not None:
+            cache.put(key, total_bonuses)
+        return total_bonuses
+    
+    def to_dict(self):
+        """
+        将地图转换为可以序列化为 JSON 的字典
+        
+        只保存已放置的区域，分块存储时未占用的区块会被直接跳过。
+        """
+        return {
+            'version': 1,
+            'radius': self.radius,
+            'width': self.width,
+            'height': self.height,
+            'chunk_size': self.chunk_size,
+            'districts': [[q, r, district.name] for q, r, district in self.iter_districts()]
+        }
+    
+    @classmethod
+    def from_dict(cls, data, districts, chunk_size=None):
+        """
+        从 to_dict() 返回的字典创建地图
+        
+        参数:
+            data: 地图数据
+            districts: create_districts() 返回的区域字典，按名称匹配区域
+            chunk_size: 覆盖数据中保存的区块边长
+        """
+        hex_grid = cls(data['radius'], data['width'], data['height'],
+                       chunk_size or data.get('chunk_size'))
+        by_name = {district.name: district for district in districts.values()}
+        for q, r, name in data['districts']:
+            if name not in by_name:
+                raise ValueError(f"未知的区域: {name}")
+            hex_grid.place_district(q, r, by_name[name])
+        return hex_grid
+    
+    def save(self, path):
+        """将地图保存为 JSON 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, path, districts, chunk_size=None):
+        """
+        从 JSON 文件加载地图
+        
+        参数:
+            path: 地图文件路径
+            districts: create_districts() 返回的区域字典，按名称匹配区域
+            chunk_size: 覆盖文件中保存的区块边长
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls.from_dict(data, districts, chunk_size)
+    
+    def get_visible_range(self, surface, offset_x, offset_y, scale, margin):
+        """
+        计算在绘制表面内可见的格子范围
+        
+        参数:
+            margin: 六边形中心到其绘制内容边缘的最大距离（像素）
+            
+        返回:
+            (q_start, q_end, r_start, r_end)，结束值不包含在范围内
+        """
+        column_distance = self.horizontal_distance * scale
+        row_distance = self.vertical_distance * scale
+        surface_width, surface_height = surface.get_size()
+        
+        q_start = max(0, math.floor((-offset_x - margin) / column_distance))
+        q_end = min(self.width, math.ceil((surface_width - offset_x + margin) / column_distance) + 1)
+        # 奇数列向下偏移半个六边形
+        r_start = max(0, math.floor((-offset_y - margin) / row_distance - 0.5))
+        r_end = min(self.height, math.ceil((surface_height - offset_y + margin) / row_distance) + 1)
+        return q_start, max(q_start, q_end), r_start, max(r_start, r_end)
+    
     def draw(self, surface, colors, font=None, offset_x=0, offset_y=0, scale=1.0):
         """绘制六边形网格（考虑偏移和缩放）"""
-        for q in range(self.width):
-            for r in range(self.height):
-                corners = self.get_hex_corners(q, r, offset_x, offset_y, scale)
-                
-                # 绘制六边形
-                district = self.grid[(q, r)]
-                color = colors['empty']
-                if district:
-                    color = district.color
-                
-                pygame.draw.polygon(surface, color, corners)
-                pygame.draw.polygon(surface, colors['border'], corners, 1)
-                
-                # 如果有区域，绘制区域名称
-                if district and font:
-                    center_x, center_y = self.hex_to_pixel(q, r)
-                    # 应用缩放和偏移
-                    center_x = center_x * scale + offset_x
-                    center_y = center_y * scale + offset_y
-                    
-                    # 分割文本行
-                    lines = district.short_name.split('\n')
-                    line_height = font.get_height()
-                    
-                    # 计算文本块的总高度
-                    total_height = line_height * len(lines)
-                    
-                    # 绘制每一行
-                    for i, line in enumerate(lines):
-                        text = font.render(line, True, colors['text'])
-                        text_rect = text.get_rect(
-                            center=(center_x, 
-                                   center_y - total_height/2 + line_height/2 + i*line_height)
-                        )
-                        surface.blit(text, text_rect)
\ No newline at end of file
+        # 根据六边形在屏幕上的大小选择细节层次
+        scaled_radius = self.radius * scale
+        # 像素块使用 8 位调色板表面，区域种类（加上空地和颜色键）不能超过 256 种
+        if (scaled_radius < LOD_BLOCK_RADIUS and numpy is not None
+                and len(self.district_list) <= 255):
+            self.draw_blocks(surface, colors, offset_x, offset_y, scale)
+            return
+        labels = font is not None and scaled_radius >= LOD_LABEL_RADIUS
+        outlines = scaled_radius >= LOD_OUTLINE_RADIUS
+        
+        # 颜色或字体变化时重建贴图集，缩放变化时贴图集按需渲染新的缩放级别
+        if self.atlas is None or not self.atlas.matches(colors, font):
+            self.atlas = HexSpriteAtlas(self.radius, colors, font)
+        stamps = self.atlas.get_bucket(scale, labels, outlines)
+        
+        # 预先渲染所有已登记区域的贴图，以便得到名称超出六边形的最大宽度
+        for district in self.district_list:
+            stamps[district]
+        margin = max(max(anchor_x, anchor_y) for _, anchor_x, anchor_y in stamps.values())
+        q_start, q_end, r_start, r_end = self.get_visible_range(
+            surface, offset_x, offset_y, scale, margin
+        )
+        
+        column_distance = self.horizontal_distance * scale
+        row_distance = self.vertical_distance * scale
+        # 坐标向下取整，使分块渲染（如导出图片）时图块边缘的像素与整体渲染一致。
+        # 偏移的整数部分单独相加，各图块的偏移只相差整数，取整前的浮点运算完全相同
+        base_x, fraction_x = split_offset(offset_x)
+        base_y, fraction_y = split_offset(offset_y)
+        
+        floor = math.floor
+        for q in range(q_start, q_end):
+            center_x = floor(q * column_distance + fraction_x) + base_x
+            top_y = (q % 2) * row_distance / 2 + fraction_y
+            
+            # 整列格子通过一次 blits 调用绘制
+            column = []
+            for r, district in enumerate(self.get_column(q, r_start, r_end), r_start):
+                stamp, anchor_x, anchor_y = stamps[district]
+                y = floor(top_y + r * row_distance) + base_y
+                column.append((stamp, (center_x - anchor_x, y - anchor_y)))
+            surface.blits(column, False)
+    
+    def draw_blocks(self, surface, colors, offset_x=0, offset_y=0, scale=1.0):
+        """
+        缩小到看不清六边形时，将每个六边形绘制为一个像素块
+        
+        只处理可见范围内的格子。每个六边形占据以其中心为中心、宽为列距、高为
+        行距的矩形，即纵向两个半行，奇数列向下错开半行。像素块的边界与 draw()
+        一样由全局坐标向下取整得到，因此分块渲染（如导出图片）时图块边缘的像素
+        与整体渲染一致。区域编号直接写入 8 位调色板表面，由 blit 转换为颜色。
+        """
+        column_distance = self.horizontal_distance * scale
+        row_distance = self.vertical_distance * scale
+        q_start, q_end, r_start, r_end = self.get_visible_range(
+            surface, offset_x, offset_y, scale, self.radius * scale
+        )
+        if q_start >= q_end or r_start >= r_end:
+            return
+        surface_width, surface_height = surface.get_size()
+        base_x, fraction_x = split_offset(offset_x)
+        base_y, fraction_y = split_offset(offset_y)
+        
+        # 每列左边缘和每个半行上边缘的像素坐标，最后一个为最后一列（半行）的结束位置
+        column_edges = numpy.floor(
+            (numpy.arange(q_start, q_end + 1) - 0.5) * column_distance + fraction_x
+        ).astype(numpy.int64) + base_x
+        half_row_edges = numpy.floor(
+            (numpy.arange(r_start * 2, r_end * 2 + 2) / 2 - 0.5) * row_distance + fraction_y
+        ).astype(numpy.int64) + base_y
+        x_start = max(0, int(column_edges[0]))
+        x_end = min(surface_width, int(column_edges[-1]))
+        y_start = max(0, int(half_row_edges[0]))
+        y_end = min(surface_height, int(half_row_edges[-1]))
+        if x_start >= x_end or y_start >= y_end:
+            return
+        
+        # 每个像素列所在的列、每个像素行所在的半行（相对可见范围的起点）
+        pixel_columns = numpy.searchsorted(
+            column_edges, numpy.arange(x_start, x_end), 'right'
+        ) - 1
+        half_rows = numpy.searchsorted(
+            half_row_edges, numpy.arange(y_start, y_end), 'right'
+        ) - 1
+        # 偶数列的第 r 行占据第 2r、2r+1 个半行，奇数列向下错开一个半行；
+        # 列首或列尾空出的半行对应额外的一行，使用调色板最后一项（透明色）
+        rows = r_end - r_start
+        even_rows = half_rows // 2
+        odd_rows = (half_rows - 1) // 2
+        odd_rows[odd_rows < 0] = rows
+        
+        palette = self.get_palette(colors)
+        window = numpy.empty((q_end - q_start, rows + 1), dtype=numpy.uint8)
+        window[:, :rows] = self.get_id_window(q_start, q_end, r_start, r_end)
+        window[:, rows] = len(palette) - 1
+        
+        columns = window[pixel_columns]
+        pixels = columns[:, even_rows]
+        odd = (pixel_columns + q_start) % 2 == 1
+        pixels[odd] = columns[odd][:, odd_rows]
+        
+        blocks = pygame.Surface(pixels.shape, 0, 8)
+        blocks.set_palette(palette)
+        pygame.surfarray.blit_array(blocks, pixels)
+        blocks.set_colorkey(len(palette) - 1)
+        surface.blit(blocks, (x_start, y_start))
+    
+    def get_palette(self, colors):
+        """
+        获取区域编号到颜色的调色板
+        
+        最后一项为颜色键，用于像素块区域中不属于任何格子的像素。
+        """
+        key = (len(self.district_list), colors['empty'])
+        if self._palette is None or self._palette[0] != key:
+            table = [colors['empty']] + [district.color for district in self.district_list[1:]]
+            table.append(HexSpriteAtlas.COLORKEY)
+            self._palette = (key, table)
+        return self._palette[1]
\ No newline at end of file
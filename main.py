@@ -1,8 +1,13 @@
 import pygame
+import os
 import sys
+import argparse
 from hexgrid import HexGrid
-from district import create_districts
+from district import create_districts, get_rules_version
 from ui import Panel, DistrictSelector, StatusBar, DescriptionPanel
+from replay import LiveInput, InputRecorder
+from cache import EvaluationCache, DEFAULT_CACHE_PATH
+from server import PlanningClient
 
 # 初始化Pygame
 pygame.init()
@@ -29,10 +34,30 @@ GRID_WIDTH = 15
 GRID_HEIGHT = 15
 hex_grid = HexGrid(HEX_RADIUS, GRID_WIDTH, GRID_HEIGHT)
 
+# 地图文件（Ctrl+S 保存）
+plan_path = "plan.json"
+
+# 多城市模式：放置区域时检查城市范围和城市间距
+multi_city = False
+
+# 协作规划客户端，连接服务器时创建
+client = None
+
+# 信息面板当前内容对应的 (选中的格子, 布局哈希)
+info_panel_key = None
+
+# 提示信息（保存结果、无法放置的原因等）
+message = None
+message_time = 0
+MESSAGE_DURATION = 3000  # 毫秒
+
 # 地图偏移和缩放
 map_offset_x = 0
 map_offset_y = 0
 map_scale = 1.0
+MIN_MAP_SCALE = 0.02
+MAX_MAP_SCALE = 4.0
+ZOOM_STEP = 1.1  # 每次滚动滚轮的缩放倍数
 dragging = False
 drag_start = None
 
@@ -89,26 +114,62 @@ colors = {
 }
 
 # 游戏主循环
-def main():
+def main(input_source=None):
+    """
+    运行主循环
+    
+    参数:
+        input_source: 输入来源，默认读取实时输入；回放时传入 InputReplayer，
+                      输入结束后函数返回
+    """
     global map_offset_x, map_offset_y, map_scale, dragging, drag_start
+    global message, message_time
     
+    if input_source is None:
+        input_source = LiveInput()
     clock = pygame.time.Clock()
     selected_hex = None
+    client_online = client.online if client else False
     
     while True:
         mouse_clicked = False
-        mouse_pos = pygame.mouse.get_pos()
+        frame = input_source.poll()
+        if frame is None:
+            input_source.close()
+            return
+        events, mouse_pos, mods = frame
+        
+        # 应用服务器发来的编辑
+        if client:
+            client.apply_updates(hex_grid)
+            if client.online != client_online:
+                client_online = client.online
+                if client_online:
+                    message = "已重新连接协作服务器，地图已同步"
+                    message_time = pygame.time.get_ticks()
+            if not client_online:
+                # 断开期间一直显示提示
+                message = "与协作服务器断开连接，正在重新连接，暂时无法编辑"
+                message_time = pygame.time.get_ticks()
         
         # 事件处理
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
+                input_source.close()
+                if client:
+                    client.close()
+                cache = hex_grid.evaluation_cache
+                if cache is not None:
+                    print(f"评估缓存: 命中 {cache.hits} 次，未命中 {cache.misses} 次，"
+                          f"命中率 {cache.hit_rate():.1%}", file=sys.stderr)
+                    cache.close()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # 左键点击
                     # 检查是否在地图区域内
                     if mouse_pos[0] < WINDOW_WIDTH - 250:
-                        if pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                        if mods & pygame.KMOD_SHIFT:
                             # 按住Shift键拖动地图
                             dragging = True
                             drag_start = mouse_pos
@@ -119,14 +180,26 @@ def main():
                 elif event.button == 4:  # 鼠标滚轮向上滚动
                     # 放大地图
                     if mouse_pos[0] < WINDOW_WIDTH - 250:
-                        map_scale = min(2.0, map_scale + 0.1)
+                        map_scale = min(MAX_MAP_SCALE, map_scale * ZOOM_STEP)
                 elif event.button == 5:  # 鼠标滚轮向下滚动
                     # 缩小地图
                     if mouse_pos[0] < WINDOW_WIDTH - 250:
-                        map_scale = max(0.5, map_scale - 0.1)
+                        map_scale = max(MIN_MAP_SCALE, map_scale / ZOOM_STEP)
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:  # 左键释放
                     dragging = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_s and mods & pygame.KMOD_CTRL:
+                    # Ctrl+S 保存地图（回放时不写文件）
+                    if not input_source.saves_enabled:
+                        message = "回放中，不保存地图"
+                    else:
+                        try:
+                            hex_grid.save(plan_path)
+                            message = f"已保存到 {plan_path}"
+                        except OSError as e:
+                            message = f"保存失败: {e}"
+                    message_time = pygame.time.get_ticks()
             elif event.type == pygame.MOUSEMOTION:
                 if dragging:
                     # 拖动地图
@@ -161,11 +234,26 @@ def main():
         
         if hex_coords:
             # 如果点击了网格并且选择了区域
-            if mouse_clicked and district_selector.selected_district and mouse_pos[0] < WINDOW_WIDTH - 250:
+            # 与服务器断开期间的编辑无法发送，重新连接后会被服务器的快照覆盖，因此不允许编辑
+            editable = not client or client_online
+            if mouse_clicked and editable and district_selector.selected_district and mouse_pos[0] < WINDOW_WIDTH - 250:
                 if district_selector.selected_district == "delete":
                     hex_grid.remove_district(*hex_coords)
+                    if client:
+                        client.send_edit(*hex_coords, None)
                 else:
-                    hex_grid.place_district(*hex_coords, district_selector.selected_district)
+                    valid, reason = True, ""
+                    if multi_city:
+                        valid, reason = hex_grid.cities.validate_placement(
+                            *hex_coords, district_selector.selected_district
+                        )
+                    if valid:
+                        hex_grid.place_district(*hex_coords, district_selector.selected_district)
+                        if client:
+                            client.send_edit(*hex_coords, district_selector.selected_district)
+                    else:
+                        message = f"无法放置: {reason}"
+                        message_time = pygame.time.get_ticks()
                 selected_hex = hex_coords
         
         # 更新信息面板
@@ -196,19 +284,34 @@ def main():
             screen.blit(current_selection, (10, 50))
         
         # 显示地图缩放信息
-        scale_info = font.render(f"缩放: {map_scale:.1f}x", True, BLACK)
+        scale_info = font.render(f"缩放: {map_scale:.2f}x", True, BLACK)
         screen.blit(scale_info, (10, 80))
         
         # 显示操作提示
         controls = font.render("按住Shift+鼠标左键拖动地图，鼠标滚轮缩放", True, BLACK)
         screen.blit(controls, (10, 110))
         
+        # 显示提示信息
+        if message and pygame.time.get_ticks() - message_time < MESSAGE_DURATION:
+            message_text = font.render(message, True, BLACK)
+            screen.blit(message_text, (10, 140))
+        
         # 更新显示
         pygame.display.flip()
-        clock.tick(60)
+        input_source.wait(clock)
 
 def update_info_panel(hex_coords):
-    """更新信息面板内容"""
+    """
+    更新信息面板内容
+    
+    只在选中的格子或地图布局变化时重新计算，否则保留上一次的内容，避免选中
+    城市中心时每一帧都查询评估结果缓存，使退出时报告的命中率反映布局的复用情况。
+    """
+    global info_panel_key
+    key = (hex_coords, hex_grid.layout_hash)
+    if key == info_panel_key:
+        return
+    info_panel_key = key
     info_panel.clear()
     
     if not hex_coords:
@@ -219,29 +322,25 @@ def update_info_panel(hex_coords):
     
     q, r = hex_coords
     district = hex_grid.get_district(q, r)
+    city = hex_grid.cities.city_at(q, r)
     
     if district:
         info_panel.set_content([
             (f"位置: ({q}, {r})", BLACK),
-            (f"区域: {district.name}", BLACK),
-            ("", BLACK),
-            ("相邻加成:", BLACK)
+            (f"区域: {district.name}", BLACK)
         ])
+        if city:
+            info_panel.content.append((f"所属城市: {city.name}", BLACK))
+        else:
+            info_panel.content.append(("", BLACK))
         
-        # 计算相邻加成
-        neighbors = hex_grid.get_neighbors(q, r)
-        total_bonuses = {}
-        
-        for neighbor_q, neighbor_r in neighbors:
-            neighbor_district = hex_grid.get_district(neighbor_q, neighbor_r)
-            if neighbor_district:
-                bonus = district.get_adjacency_bonus(neighbor_district)
-                if bonus:
-                    bonus_type, bonus_value = bonus
-                    if bonus_type in total_bonuses:
-                        total_bonuses[bonus_type] += bonus_value
-                    else:
-                        total_bonuses[bonus_type] = bonus_value
+        if city and (city.q, city.r) == (q, r):
+            # 城市中心显示整个城市的相邻加成总和
+            info_panel.content.append(("城市总加成:", BLACK))
+            total_bonuses = hex_grid.cities.city_yields(city)
+        else:
+            info_panel.content.append(("相邻加成:", BLACK))
+            total_bonuses = hex_grid.calculate_adjacency(q, r)
         
         # 显示加成
         for bonus_type, bonus_value in total_bonuses.items():
@@ -251,6 +350,45 @@ def update_info_panel(hex_coords):
             (f"位置: ({q}, {r})", BLACK),
             ("空地", BLACK)
         ])
+        if city:
+            info_panel.content.append((f"所属城市: {city.name}", BLACK))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="文明6区域规划模拟器")
+    parser.add_argument('--record', metavar='FILE', help="将输入事件录制到文件，可用 replay.py 回放")
+    parser.add_argument('--plan', metavar='FILE',
+                        help="地图文件，存在时启动时加载，Ctrl+S 保存到此文件（默认: plan.json）")
+    parser.add_argument('--map-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help="新地图的尺寸（六边形数量）")
+    parser.add_argument('--chunk-size', type=int,
+                        help="使用分块稀疏存储，指定区块边长（偶数），适合大地图")
+    parser.add_argument('--multi-city', action='store_true',
+                        help="多城市模式：区域必须建在城市中心3格范围内，城市中心之间至少相距4格")
+    parser.add_argument('--eval-cache', metavar='FILE', default=DEFAULT_CACHE_PATH,
+                        help="评估结果缓存文件（默认: %(default)s）")
+    parser.add_argument('--no-eval-cache', action='store_true', help="不使用评估结果缓存")
+    parser.add_argument('--connect', metavar='HOST:PORT',
+                        help="以客户端模式连接协作规划服务器（server.py），地图由服务器提供")
+    args = parser.parse_args()
+    if args.record and args.connect:
+        # 服务器发来的编辑不在录制文件中，回放结果无法复现
+        parser.error("--record 不能与 --connect 同时使用")
+    
+    multi_city = args.multi_city
+    
+    if args.plan:
+        plan_path = args.plan
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        client = PlanningClient(host or '127.0.0.1', int(port), districts)
+        width, height = client.start()
+        hex_grid = HexGrid(HEX_RADIUS, width, height, args.chunk_size)
+    elif args.plan and os.path.exists(args.plan):
+        hex_grid = HexGrid.load(args.plan, districts, args.chunk_size)
+    elif args.map_size or args.chunk_size:
+        width, height = args.map_size or (GRID_WIDTH, GRID_HEIGHT)
+        hex_grid = HexGrid(HEX_RADIUS, width, height, args.chunk_size)
+    if not args.no_eval_cache:
+        hex_grid.evaluation_cache = EvaluationCache(args.eval_cache, get_rules_version(districts))
+    
+    main(InputRecorder(args.record, hex_grid, multi_city) if args.record else None)
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+输入录制与回放
+
+录制模式下，主循环每一帧读取到的事件、鼠标位置和修饰键都会连同时间戳写入
+gzip 压缩的 JSON Lines 文件。回放模式在无头环境中把这些帧重新喂给
+main.main()，可以按最快速度或按录制时的真实时间回放，结束后报告帧耗时统计
+和最终地图状态的哈希，用于比较不同版本主循环的正确性和速度。
+
+录制文件的头部保存了初始地图（尺寸、分块设置和已放置的区域）和多城市模式
+设置，回放前先恢复这些状态，因此使用 --plan、--map-size 等参数录制的会话
+也能得到可比较的最终哈希。
+
+用法:
+    python main.py --record session.rec.gz     # 录制
+    python replay.py session.rec.gz            # 最快速度无头回放
+    python replay.py session.rec.gz --realtime # 按录制时间回放
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+
+import pygame
+
+FORMAT_VERSION = 2
+
+# 需要录制的事件类型，其余事件主循环不会处理
+RECORDED_EVENT_TYPES = (
+    pygame.QUIT,
+    pygame.MOUSEBUTTONDOWN,
+    pygame.MOUSEBUTTONUP,
+    pygame.MOUSEMOTION,
+    pygame.KEYDOWN,
+    pygame.KEYUP
+)
+
+class LiveInput:
+    """从 pygame 实时读取输入"""
+
+    # 是否允许保存地图文件（回放时不写文件）
+    saves_enabled = True
+
+    def poll(self):
+        """
+        读取一帧的输入
+
+        返回:
+            (事件列表, 鼠标位置, 修饰键状态)，输入结束时返回 None
+        """
+        return pygame.event.get(), pygame.mouse.get_pos(), pygame.key.get_mods()
+
+    def wait(self, clock):
+        """帧结束时调用，限制帧率"""
+        clock.tick(60)
+
+    def close(self):
+        """释放资源"""
+        pass
+
+class InputRecorder(LiveInput):
+    """读取实时输入的同时把每一帧写入录制文件"""
+
+    def __init__(self, path, hex_grid, multi_city=False):
+        """
+        初始化录制
+
+        参数:
+            path: 录制文件路径
+            hex_grid: 录制开始时的地图，保存到文件头部
+            multi_city: 是否为多城市模式
+        """
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.file.write(json.dumps({
+            'format': FORMAT_VERSION,
+            'pygame': pygame.version.ver,
+            'multi_city': multi_city,
+            'plan': hex_grid.to_dict(),
+            'map_hash': map_state_hash(hex_grid)
+        }, ensure_ascii=False) + '\n')
+        self.start_time = time.perf_counter()
+        self.last_state = None
+
+    def poll(self):
+        events, mouse_pos, mods = super().poll()
+        t = round((time.perf_counter() - self.start_time) * 1000, 1)
+        recorded = [
+            [event.type, _encode_attrs(event.dict)]
+            for event in events if event.type in RECORDED_EVENT_TYPES
+        ]
+        state = (mouse_pos, mods)
+        if recorded or state != self.last_state:
+            frame = [t, mouse_pos[0], mouse_pos[1], mods, recorded]
+        else:
+            # 没有事件且鼠标和修饰键未变化的帧只记录时间戳
+            frame = [t]
+        self.last_state = state
+        self.file.write(json.dumps(frame, separators=(',', ':')) + '\n')
+        return events, mouse_pos, mods
+
+    def close(self):
+        self.file.close()
+
+class InputReplayer:
+    """从录制文件回放输入，并统计每一帧的耗时"""
+
+    saves_enabled = False
+
+    def __init__(self, path, realtime=False):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.header = json.loads(f.readline())
+            if self.header.get('format') != FORMAT_VERSION:
+                raise ValueError(f"不支持的录制文件格式: {self.header.get('format')}")
+            self.frames = [json.loads(line) for line in f if line.strip()]
+        self.realtime = realtime
+        self.index = 0
+        self.mouse_pos = (0, 0)
+        self.mods = 0
+        self.frame_times = []
+        self.start_time = None
+        self.frame_start = None
+
+    def poll(self):
+        if self.index >= len(self.frames):
+            return None
+        frame = self.frames[self.index]
+        self.index += 1
+
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now - frame[0] / 1000
+        self.frame_start = now
+
+        events = []
+        if len(frame) > 1:
+            _, x, y, self.mods, recorded = frame
+            self.mouse_pos = (x, y)
+            for event_type, attrs in recorded:
+                # 退出事件不回放，回放结束后主循环自然返回
+                if event_type != pygame.QUIT:
+                    events.append(pygame.event.Event(event_type, _decode_attrs(attrs)))
+        return events, self.mouse_pos, self.mods
+
+    def wait(self, clock):
+        self.frame_times.append((time.perf_counter() - self.frame_start) * 1000)
+        if self.realtime and self.index < len(self.frames):
+            # 等待到下一帧的录制时间
+            target = self.start_time + self.frames[self.index][0] / 1000
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        """返回帧耗时统计（毫秒）"""
+        times = sorted(self.frame_times)
+        if not times:
+            return {'frames': 0}
+        return {
+            'frames': len(times),
+            'total_ms': sum(times),
+            'mean_ms': statistics.mean(times),
+            'median_ms': statistics.median(times),
+            'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+            'max_ms': times[-1]
+        }
+
+def _encode_attrs(attrs):
+    """保留事件属性中可以序列化为 JSON 的部分"""
+    encoded = {}
+    for key, value in attrs.items():
+        if isinstance(value, (tuple, list)):
+            value = list(value)
+            if all(isinstance(v, (int, float)) for v in value):
+                encoded[key] = value
+        elif isinstance(value, (bool, int, float, str)):
+            encoded[key] = value
+    return encoded
+
+def _decode_attrs(attrs):
+    """将 JSON 中的列表还原为 pygame 事件使用的元组"""
+    return {
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in attrs.items()
+    }
+
+def map_state_hash(hex_grid):
+    """计算地图上所有区域布局的哈希，用于比较回放结果"""
+    digest = hashlib.sha1()
+    digest.update(f"{hex_grid.width}x{hex_grid.height}".encode('utf-8'))
+    for q, r, district in sorted(hex_grid.iter_districts(), key=lambda item: item[:2]):
+        digest.update(f";{q},{r},{district.name}".encode('utf-8'))
+    return digest.hexdigest()
+
+def run_replay(path, realtime=False, eval_cache=None):
+    """
+    无头回放录制文件，返回帧耗时统计和最终地图哈希
+
+    参数:
+        eval_cache: 评估结果缓存文件，指定时报告中包含缓存命中率
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import main
+    from cache import EvaluationCache
+    from district import get_rules_version
+    from hexgrid import HexGrid
+
+    replayer = InputReplayer(path, realtime)
+    # 恢复录制开始时的地图和模式
+    main.hex_grid = HexGrid.from_dict(replayer.header['plan'], main.districts)
+    main.multi_city = replayer.header['multi_city']
+    if map_state_hash(main.hex_grid) != replayer.header['map_hash']:
+        raise ValueError("无法恢复录制开始时的地图（区域定义可能已经改变）")
+
+    if eval_cache:
+        main.hex_grid.evaluation_cache = EvaluationCache(
+            eval_cache, get_rules_version(main.districts)
+        )
+    main.main(replayer)
+    report = replayer.stats()
+    report['map_hash'] = map_state_hash(main.hex_grid)
+    if main.hex_grid.evaluation_cache is not None:
+        report['evaluation_cache'] = main.hex_grid.evaluation_cache.stats()
+        main.hex_grid.evaluation_cache.close()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="无头回放录制的输入并报告性能统计")
+    parser.add_argument('recording', help="由 main.py --record 生成的录制文件")
+    parser.add_argument('--realtime', action='store_true', help="按录制时的真实时间回放")
+    parser.add_argument('--eval-cache', metavar='FILE', help="回放时使用的评估结果缓存文件")
+    args = parser.parse_args()
+
+    json.dump(run_replay(args.recording, args.realtime, args.eval_cache), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,388 @@
+"""
+本地协作规划服务器
+
+服务器持有权威的地图，规划客户端发送编辑，服务器把短时间内的连续编辑合并
+（同一格子只保留最后一次）后，以紧凑的二进制增量广播给所有客户端。新加入的
+客户端会先收到完整快照。
+
+用法:
+    python server.py --port 8765 --map-size 60 40       # 启动服务器
+    python main.py --connect 127.0.0.1:8765             # 以客户端模式启动规划器
+
+协议（网络字节序）:每条消息为 1 字节类型 + 4 字节负载长度 + 负载。
+    HELLO    服务器 -> 客户端  规则版本（16 字节 ASCII）
+    SNAPSHOT 服务器 -> 客户端  版本 u64、宽 u32、高 u32、数量 u32，然后是若干格子
+    DELTAS   服务器 -> 客户端  版本 u64、数量 u32，然后是若干格子
+    EDIT     客户端 -> 服务器  一个格子
+每个格子为 q u32、r u32、区域编号 u16，区域编号为 create_districts() 中的顺序
+加 1，0 表示空地。同一批增量共享一个版本号。
+"""
+import argparse
+import asyncio
+import queue
+import struct
+import sys
+import threading
+
+from hexgrid import HexGrid
+from district import create_districts, get_rules_version
+
+HEX_RADIUS = 30  # 与 main.py 一致，只影响保存的地图文件
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 合并编辑的时间窗口（秒）
+BATCH_INTERVAL = 0.02
+# 客户端发送缓冲区超过此大小时断开连接，客户端重新连接后通过快照重新同步
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024
+# 客户端断开后重新连接的等待时间（秒），每次失败后加倍，直到上限
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 5.0
+
+MSG_HELLO = 1
+MSG_SNAPSHOT = 2
+MSG_DELTAS = 3
+MSG_EDIT = 4
+
+HEADER = struct.Struct('>BI')
+TILE = struct.Struct('>IIH')
+SNAPSHOT_HEADER = struct.Struct('>QIII')
+DELTAS_HEADER = struct.Struct('>QI')
+
+def encode_message(message_type, payload):
+    """编码一条消息"""
+    return HEADER.pack(message_type, len(payload)) + payload
+
+def encode_tiles(tiles):
+    """编码 (q, r, 区域编号) 列表"""
+    return b''.join(TILE.pack(q, r, district_id) for q, r, district_id in tiles)
+
+def decode_tiles(data, count):
+    """解码 count 个格子"""
+    return [TILE.unpack_from(data, i * TILE.size) for i in range(count)]
+
+async def read_message(reader):
+    """读取一条消息，返回 (类型, 负载)"""
+    header = await reader.readexactly(HEADER.size)
+    message_type, length = HEADER.unpack(header)
+    payload = await reader.readexactly(length)
+    return message_type, payload
+
+class RulesMismatchError(ConnectionError):
+    """服务器与客户端的区域规则不一致"""
+
+class DistrictTable:
+    """区域与协议中区域编号的对应关系"""
+
+    def __init__(self, districts):
+        self.districts = list(districts.values())
+        self.ids = {district: i + 1 for i, district in enumerate(self.districts)}
+        self.rules_version = get_rules_version(districts)
+
+    def to_id(self, district):
+        """区域对象转换为编号"""
+        return self.ids[district] if district is not None else 0
+
+    def from_id(self, district_id):
+        """编号转换为区域对象"""
+        if district_id == 0:
+            return None
+        if district_id > len(self.districts):
+            raise ValueError(f"未知的区域编号: {district_id}")
+        return self.districts[district_id - 1]
+
+class PlanningServer:
+    """协作规划服务器"""
+
+    def __init__(self, hex_grid, districts, batch_interval=BATCH_INTERVAL):
+        """
+        初始化服务器
+
+        参数:
+            hex_grid: 权威地图
+            districts: create_districts() 返回的区域字典
+            batch_interval: 合并编辑的时间窗口（秒）
+        """
+        self.hex_grid = hex_grid
+        self.table = DistrictTable(districts)
+        self.batch_interval = batch_interval
+        self.version = 0
+        self.clients = set()
+        # 等待广播的编辑，同一格子只保留最后一次
+        self.pending = {}
+        self.flush_handle = None
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """开始监听，返回实际监听的端口"""
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """停止服务器并断开所有客户端"""
+        self.flush()
+        self.server.close()
+        for writer in list(self.clients):
+            writer.close()
+        await self.server.wait_closed()
+
+    def snapshot(self):
+        """编码当前地图的快照"""
+        tiles = [(q, r, self.table.to_id(district))
+                 for q, r, district in self.hex_grid.iter_districts()]
+        payload = SNAPSHOT_HEADER.pack(self.version, self.hex_grid.width,
+                                       self.hex_grid.height, len(tiles))
+        return encode_message(MSG_SNAPSHOT, payload + encode_tiles(tiles))
+
+    async def handle_client(self, reader, writer):
+        writer.write(encode_message(MSG_HELLO, self.table.rules_version.encode('ascii')))
+        writer.write(self.snapshot())
+        self.clients.add(writer)
+        try:
+            while True:
+                message_type, payload = await read_message(reader)
+                if message_type == MSG_EDIT:
+                    q, r, district_id = TILE.unpack(payload)
+                    self.submit_edit(q, r, district_id)
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error, ValueError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def submit_edit(self, q, r, district_id):
+        """记录一次编辑，在时间窗口结束时批量广播"""
+        if (q, r) not in self.hex_grid.grid:
+            return
+        self.table.from_id(district_id)
+        self.pending[(q, r)] = district_id
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(self.batch_interval, self.flush)
+
+    def flush(self):
+        """
+        将等待中的编辑应用到地图，并广播所有被编辑的格子
+
+        即使服务器上的值没有变化也要广播：客户端在发送编辑前已经修改了本地地图，
+        同一时间窗口内其他客户端把格子改回原值时，前者需要收到最终结果。
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        changes = []
+        for (q, r), district_id in self.pending.items():
+            district = self.table.from_id(district_id)
+            if self.hex_grid.get_district(q, r) is not district:
+                if district is None:
+                    self.hex_grid.remove_district(q, r)
+                else:
+                    self.hex_grid.place_district(q, r, district)
+            changes.append((q, r, district_id))
+        self.pending.clear()
+        if not changes:
+            return
+
+        self.version += 1
+        message = encode_message(
+            MSG_DELTAS, DELTAS_HEADER.pack(self.version, len(changes)) + encode_tiles(changes)
+        )
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.clients.discard(writer)
+                writer.close()
+            else:
+                writer.write(message)
+
+class PlanningClient:
+    """
+    协作规划客户端
+
+    在后台线程中运行 asyncio 事件循环接收服务器消息，收到的快照和增量放入队列，
+    由主循环每帧调用 apply_updates() 应用到本地地图，不会阻塞渲染。连接断开后
+    （包括因为接收太慢被服务器断开）自动重新连接，并通过新的快照重新同步地图；
+    断开期间 online 为 False，发送的编辑会被丢弃。
+    """
+
+    def __init__(self, host, port, districts, reconnect_delay=RECONNECT_DELAY):
+        """
+        初始化客户端
+
+        参数:
+            host, port: 服务器地址
+            districts: create_districts() 返回的区域字典
+            reconnect_delay: 断开后第一次重新连接前等待的时间（秒），之后逐次加倍
+        """
+        self.host = host
+        self.port = port
+        self.table = DistrictTable(districts)
+        self.reconnect_delay = reconnect_delay
+        self.updates = queue.Queue()
+        self.version = 0
+        self.size = None
+        self.connected = threading.Event()
+        # 当前是否与服务器保持连接
+        self.online = False
+        self.error = None
+        self.closing = False
+        self.loop = None
+        self.task = None
+        self.writer = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self, timeout=5.0):
+        """
+        连接服务器并等待第一个快照
+
+        返回:
+            (宽, 高)，用于创建本地地图
+        """
+        self.thread.start()
+        if not self.connected.wait(timeout):
+            raise ConnectionError(f"连接 {self.host}:{self.port} 超时")
+        if self.size is None:
+            raise ConnectionError(f"无法连接 {self.host}:{self.port}: {self.error}")
+        return self.size
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.task = self.loop.create_task(self._receive())
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.online = False
+            self.connected.set()
+            self.loop.close()
+
+    async def _receive(self):
+        delay = self.reconnect_delay
+        while not self.closing:
+            try:
+                await self._session()
+                delay = self.reconnect_delay
+            except RulesMismatchError as e:
+                # 重新连接也无法解决，停止
+                self.error = e
+                return
+            except (OSError, asyncio.IncompleteReadError, struct.error) as e:
+                self.error = e
+            finally:
+                self.online = False
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+            if self.size is None:
+                # 第一次连接失败时由 start() 报告错误，不重试
+                self.connected.set()
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _session(self):
+        """建立一次连接并接收消息，直到连接断开"""
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        message_type, payload = await read_message(reader)
+        if message_type != MSG_HELLO or payload.decode('ascii') != self.table.rules_version:
+            raise RulesMismatchError("服务器的区域规则与本地不一致")
+        while True:
+            message_type, payload = await read_message(reader)
+            if message_type == MSG_SNAPSHOT:
+                version, width, height, count = SNAPSHOT_HEADER.unpack_from(payload)
+                tiles = decode_tiles(payload[SNAPSHOT_HEADER.size:], count)
+                self.updates.put(('snapshot', version, tiles))
+                self.online = True
+                if self.size is None:
+                    self.size = (width, height)
+                    self.connected.set()
+            elif message_type == MSG_DELTAS:
+                version, count = DELTAS_HEADER.unpack_from(payload)
+                tiles = decode_tiles(payload[DELTAS_HEADER.size:], count)
+                self.updates.put(('deltas', version, tiles))
+
+    def _write(self, message):
+        if self.writer is not None:
+            self.writer.write(message)
+
+    def send_edit(self, q, r, district):
+        """发送一次编辑（可在任意线程调用），未连接时丢弃"""
+        if not self.online or self.loop.is_closed():
+            return
+        message = encode_message(MSG_EDIT, TILE.pack(q, r, self.table.to_id(district)))
+        try:
+            self.loop.call_soon_threadsafe(self._write, message)
+        except RuntimeError:
+            # 事件循环已在另一线程中关闭
+            pass
+
+    def apply_updates(self, hex_grid):
+        """
+        将收到的快照和增量应用到本地地图（不阻塞）
+
+        返回:
+            是否应用了任何更新
+        """
+        applied = False
+        while True:
+            try:
+                kind, version, tiles = self.updates.get_nowait()
+            except queue.Empty:
+                return applied
+            if kind == 'snapshot':
+                for q, r, _ in list(hex_grid.iter_districts()):
+                    hex_grid.remove_district(q, r)
+            for q, r, district_id in tiles:
+                district = self.table.from_id(district_id)
+                if district is None:
+                    hex_grid.remove_district(q, r)
+                else:
+                    hex_grid.place_district(q, r, district)
+            self.version = version
+            applied = True
+
+    def close(self):
+        """断开连接并停止重新连接"""
+        self.closing = True
+        if self.task is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                pass
+        self.thread.join(timeout=1.0)
+
+async def serve(hex_grid, districts, host, port):
+    """运行服务器直到被中断"""
+    server = PlanningServer(hex_grid, districts)
+    port = await server.start(host, port)
+    print(f"协作规划服务器已启动: {host}:{port}", file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="文明6区域规划模拟器协作服务器")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="监听地址（默认: %(default)s）")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口（默认: %(default)s）")
+    parser.add_argument('--plan', metavar='FILE', help="启动时加载的地图文件，退出时保存回此文件")
+    parser.add_argument('--map-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        default=(15, 15), help="新地图的尺寸（默认: 15 15）")
+    parser.add_argument('--chunk-size', type=int, help="使用分块稀疏存储，指定区块边长（偶数）")
+    args = parser.parse_args()
+
+    districts = create_districts()
+    if args.plan:
+        try:
+            hex_grid = HexGrid.load(args.plan, districts, args.chunk_size)
+        except FileNotFoundError:
+            hex_grid = HexGrid(HEX_RADIUS, *args.map_size, args.chunk_size)
+    else:
+        hex_grid = HexGrid(HEX_RADIUS, *args.map_size, args.chunk_size)
+
+    try:
+        asyncio.run(serve(hex_grid, districts, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.plan:
+            hex_grid.save(args.plan)
@@ -0,0 +1,132 @@
+"""
+协作规划服务器的本地回环测试
+
+服务器在后台线程的事件循环中运行，客户端使用真实的 PlanningClient 通过
+127.0.0.1 连接。
+
+用法:
+    python -m unittest test_server
+"""
+import asyncio
+import threading
+import time
+import unittest
+
+from hexgrid import HexGrid
+from district import create_districts
+from server import PlanningServer, PlanningClient
+
+HEX_RADIUS = 30
+TIMEOUT = 5.0
+
+def grid_state(hex_grid):
+    """地图上所有区域的 {坐标: 区域名称}"""
+    return {(q, r): district.name for q, r, district in hex_grid.iter_districts()}
+
+class PlanningServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.districts = create_districts()
+        self.server_grid = HexGrid(HEX_RADIUS, 10, 10)
+        self.server_grid.place_district(1, 1, self.districts['campus'])
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = self.call(self.make_server)
+        self.port = self.call(self.server.start('127.0.0.1', 0))
+        self.clients = []
+
+    def tearDown(self):
+        for client, _ in self.clients:
+            client.close()
+        self.call(self.server.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(TIMEOUT)
+        self.loop.close()
+
+    async def make_server(self):
+        # 加长合并窗口，使测试中的编辑一定落在同一窗口内
+        return PlanningServer(self.server_grid, self.districts, batch_interval=0.2)
+
+    def call(self, coroutine):
+        """在服务器的事件循环中运行协程并等待结果"""
+        if not asyncio.iscoroutine(coroutine):
+            coroutine = coroutine()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(TIMEOUT)
+
+    def connect(self):
+        client = PlanningClient('127.0.0.1', self.port, self.districts, reconnect_delay=0.05)
+        width, height = client.start()
+        hex_grid = HexGrid(HEX_RADIUS, width, height)
+        self.clients.append((client, hex_grid))
+        self.wait_until(lambda: grid_state(hex_grid) == grid_state(self.server_grid))
+        return client, hex_grid
+
+    def wait_until(self, predicate):
+        """应用客户端收到的更新，直到条件成立"""
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            for client, hex_grid in self.clients:
+                client.apply_updates(hex_grid)
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("等待超时")
+
+    def edit(self, client, hex_grid, q, r, district):
+        """与 main.py 相同：先修改本地地图，再发送编辑"""
+        hex_grid.place_district(q, r, district)
+        client.send_edit(q, r, district)
+
+    def assert_converged(self):
+        expected = grid_state(self.server_grid)
+        self.wait_until(lambda: all(
+            grid_state(hex_grid) == expected for _, hex_grid in self.clients
+        ))
+
+    def test_late_joiner_receives_snapshot(self):
+        client_a, grid_a = self.connect()
+        self.edit(client_a, grid_a, 3, 4, self.districts['theater_square'])
+        self.wait_until(lambda: self.server_grid.get_district(3, 4) is not None)
+        self.assert_converged()
+
+        _, grid_b = self.connect()
+        self.assertEqual(grid_state(grid_b), grid_state(self.server_grid))
+
+    def test_edit_reverted_in_same_window_is_broadcast(self):
+        client_a, grid_a = self.connect()
+        client_b, grid_b = self.connect()
+        campus = self.districts['campus']
+
+        # B 把学院区改成剧院广场，同一窗口内 A 又改回学院区，服务器的值没有变化
+        self.edit(client_b, grid_b, 1, 1, self.districts['theater_square'])
+        self.wait_until(lambda: (1, 1) in self.server.pending)
+        self.edit(client_a, grid_a, 1, 1, campus)
+
+        self.wait_until(lambda: grid_b.get_district(1, 1) is campus)
+        self.assertIs(self.server_grid.get_district(1, 1), campus)
+        self.assert_converged()
+
+    def test_client_resyncs_after_being_dropped(self):
+        client_a, grid_a = self.connect()
+        client_b, grid_b = self.connect()
+
+        def drop_clients():
+            # 直接修改服务器地图不会广播增量，客户端只能从重新连接后的快照得到它
+            self.server_grid.place_district(5, 5, self.districts['harbor'])
+            # 模拟因接收太慢被服务器断开
+            for writer in list(self.server.clients):
+                writer.close()
+        self.loop.call_soon_threadsafe(drop_clients)
+
+        self.wait_until(lambda: grid_a.get_district(5, 5) is self.districts['harbor'])
+        self.wait_until(lambda: client_a.online and client_b.online)
+        self.assert_converged()
+
+        # 重新连接后可以继续编辑
+        self.edit(client_a, grid_a, 6, 6, self.districts['commercial_hub'])
+        self.wait_until(lambda: self.server_grid.get_district(6, 6) is not None)
+        self.assert_converged()
+
+if __name__ == "__main__":
+    unittest.main()